@@ -8,12 +8,72 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
-import json
+import orjson
 import os
+from collections import Counter
+from numba import njit
 
 from data_preprocessing import DataLoader
 from feature_engineering import FeatureEngineer
 
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DAY_DTYPE = pd.CategoricalDtype(DAY_NAMES, ordered=True)
+
+# Reductions supported by _window_aggregate
+WINDOW_SUM, WINDOW_COUNT, WINDOW_MEAN, WINDOW_LAST = 0, 1, 2, 3
+
+@njit(cache=True)
+def _window_aggregate(dt, values, seizure_ns, window_ns, op):
+    """
+    Reduce the non-missing values in [t - window, t) for each seizure time t
+    
+    dt must be sorted int64 nanoseconds aligned with values. Sums over empty
+    windows are 0; means and last values are NaN.
+    """
+    out = np.empty(len(seizure_ns))
+    for k in range(len(seizure_ns)):
+        lo = np.searchsorted(dt, seizure_ns[k] - window_ns)
+        hi = np.searchsorted(dt, seizure_ns[k])
+        
+        if op == WINDOW_LAST:
+            out[k] = np.nan
+            for i in range(hi - 1, lo - 1, -1):
+                if not np.isnan(values[i]):
+                    out[k] = values[i]
+                    break
+            continue
+        
+        total = 0.0
+        count = 0
+        for i in range(lo, hi):
+            if not np.isnan(values[i]):
+                total += values[i]
+                count += 1
+        
+        if op == WINDOW_SUM:
+            out[k] = total
+        elif op == WINDOW_COUNT:
+            out[k] = count
+        elif count > 0:
+            out[k] = total / count
+        else:
+            out[k] = np.nan
+    return out
+
+@njit(cache=True)
+def _interval_stats(intervals):
+    """Mean, median, min and max of the inter-seizure intervals in one pass"""
+    total = 0.0
+    min_hours = intervals[0]
+    max_hours = intervals[0]
+    for value in intervals:
+        total += value
+        if value < min_hours:
+            min_hours = value
+        if value > max_hours:
+            max_hours = value
+    return total / len(intervals), np.median(intervals), min_hours, max_hours
+
 class TriggerAnalyzer:
     def __init__(self):
         self.results = {}
@@ -26,20 +86,35 @@ class TriggerAnalyzer:
         print("SEIZURE TRIGGER ANALYSIS")
         print("=" * 60)
         
+        # Column means/stds shared by the sleep, pain and activity analyzers
+        stat_cols = [col for col in ['Sleep Analysis [Total] (hr)', 'Pain',
+                                     'Walking + Running Distance (mi)'] if col in df.columns]
+        col_stats = df[stat_cols].agg(['mean', 'std']).to_dict()
+        
+        # Hoist the columns the window analyzers read into plain arrays,
+        # with DateTime as int64 nanoseconds for the window searches
+        window_cols = ['Heart Rate [Avg] (count/min)', 'Sleep Analysis [Total] (hr)',
+                       'Pain', 'Walking + Running Distance (mi)']
+        arrays = {col: df[col].to_numpy(dtype=np.float64)
+                  for col in window_cols if col in df.columns}
+        arrays['DateTime'] = df['DateTime'].to_numpy(dtype='datetime64[ns]').view('i8')
+        arrays['seizure'] = df['seizure'].to_numpy()
+        seizure_ns = seizures['DateTime'].dt.floor('H').to_numpy(dtype='datetime64[ns]').view('i8')
+        
         # Temporal patterns
         self.results['temporal'] = self._analyze_temporal_patterns(seizures)
         
         # Physiological patterns
-        self.results['physiological'] = self._analyze_physiological_patterns(df, seizures)
+        self.results['physiological'] = self._analyze_physiological_patterns(arrays, seizure_ns)
         
         # Sleep patterns
-        self.results['sleep'] = self._analyze_sleep_patterns(df, seizures)
+        self.results['sleep'] = self._analyze_sleep_patterns(arrays, seizure_ns, col_stats)
         
         # Pain patterns
-        self.results['pain'] = self._analyze_pain_patterns(df, seizures)
+        self.results['pain'] = self._analyze_pain_patterns(arrays, seizure_ns, col_stats)
         
         # Activity patterns
-        self.results['activity'] = self._analyze_activity_patterns(df, seizures)
+        self.results['activity'] = self._analyze_activity_patterns(arrays, seizure_ns, col_stats)
         
         # Food patterns
         self.results['food'] = self._analyze_food_patterns(seizures)
@@ -54,12 +129,15 @@ class TriggerAnalyzer:
         print("\n1. TEMPORAL PATTERNS")
         print("-" * 60)
         
-        seizures['hour'] = seizures['DateTime'].dt.hour
-        seizures['day_of_week'] = seizures['DateTime'].dt.dayofweek
-        seizures['day_name'] = seizures['DateTime'].dt.day_name()
+        # Tally hours and weekdays as integer codes; derived columns are
+        # not added to the caller's seizures frame
+        hours = seizures['DateTime'].dt.hour.to_numpy()
+        days = seizures['DateTime'].dt.dayofweek.to_numpy()
         
         # Hour of day distribution
-        hour_dist = seizures['hour'].value_counts().sort_index()
+        hour_dist = pd.Series(np.bincount(hours, minlength=24), name='count')
+        hour_dist.index.name = 'hour'
+        hour_dist = hour_dist[hour_dist > 0]
         print("\nSeizures by hour of day:")
         print(hour_dist)
         
@@ -68,8 +146,10 @@ class TriggerAnalyzer:
         print(f"\nMost common hours: {list(top_hours.index)} "
               f"({top_hours.sum()} seizures, {top_hours.sum()/len(seizures)*100:.1f}%)")
         
-        # Day of week distribution
-        day_dist = seizures['day_name'].value_counts()
+        # Day of week distribution, in weekday order
+        day_index = pd.CategoricalIndex(DAY_NAMES, dtype=DAY_DTYPE, name='day_name')
+        day_dist = pd.Series(np.bincount(days, minlength=7), index=day_index, name='count')
+        day_dist = day_dist[day_dist > 0]
         print("\nSeizures by day of week:")
         print(day_dist)
         
@@ -80,7 +160,7 @@ class TriggerAnalyzer:
             'peak_days': list(day_dist.nlargest(2).index)
         }
     
-    def _analyze_physiological_patterns(self, df, seizures):
+    def _analyze_physiological_patterns(self, arrays, seizure_ns):
         """Analyze heart rate and physiological patterns"""
         print("\n2. PHYSIOLOGICAL PATTERNS")
         print("-" * 60)
@@ -89,41 +169,44 @@ class TriggerAnalyzer:
         
         # Compare heart rate before seizures vs normal
         hr_avg_col = 'Heart Rate [Avg] (count/min)'
-        if hr_avg_col in df.columns:
-            # Get hours before seizures
-            pre_seizure_hrs = []
-            for _, seizure in seizures.iterrows():
-                hour = seizure['DateTime'].floor('H')
-                # Get 6 hours before seizure
-                pre_hours = df[
-                    (df['DateTime'] >= hour - pd.Timedelta(hours=6)) & 
-                    (df['DateTime'] < hour)
-                ]
-                pre_seizure_hrs.extend(pre_hours[hr_avg_col].dropna().tolist())
+        if hr_avg_col in arrays:
+            # Pool all readings in the 6 hours before each seizure
+            # (overlapping windows count twice)
+            hr = arrays[hr_avg_col]
+            hr_sums = self._pre_seizure(arrays, seizure_ns, hr, 6, WINDOW_SUM)
+            hr_sumsq = self._pre_seizure(arrays, seizure_ns, hr ** 2, 6, WINDOW_SUM)
+            n_pre = self._pre_seizure(arrays, seizure_ns, hr, 6, WINDOW_COUNT).sum()
             
             # Get normal hours (no seizure within 24 hours)
-            normal_hrs = df[df['seizure'] == 0][hr_avg_col].dropna()
+            normal_hrs = hr[(arrays['seizure'] == 0) & ~np.isnan(hr)]
+            normal_avg = normal_hrs.mean()
             
-            if len(pre_seizure_hrs) > 0:
-                t_stat, p_value = stats.ttest_ind(pre_seizure_hrs, normal_hrs, equal_var=False)
+            if n_pre > 0:
+                pre_mean = hr_sums.sum() / n_pre
+                pre_var = (hr_sumsq.sum() - n_pre * pre_mean ** 2) / (n_pre - 1) if n_pre > 1 else np.nan
+                t_stat, p_value = stats.ttest_ind_from_stats(
+                    pre_mean, np.sqrt(max(pre_var, 0.0)), n_pre,
+                    normal_avg, normal_hrs.std(ddof=1), len(normal_hrs),
+                    equal_var=False
+                )
                 
-                print(f"\nAverage heart rate before seizures: {np.mean(pre_seizure_hrs):.1f} bpm")
-                print(f"Average heart rate (normal): {normal_hrs.mean():.1f} bpm")
+                print(f"\nAverage heart rate before seizures: {pre_mean:.1f} bpm")
+                print(f"Average heart rate (normal): {normal_avg:.1f} bpm")
                 print(f"Statistical significance: p={p_value:.4f}")
                 
                 if p_value < 0.05:
                     print("⚠️  SIGNIFICANT DIFFERENCE DETECTED")
                 
                 results['heart_rate'] = {
-                    'pre_seizure_avg': float(np.mean(pre_seizure_hrs)),
-                    'normal_avg': float(normal_hrs.mean()),
+                    'pre_seizure_avg': float(pre_mean),
+                    'normal_avg': float(normal_avg),
                     'p_value': float(p_value),
                     'significant': bool(p_value < 0.05)
                 }
         
         return results
     
-    def _analyze_sleep_patterns(self, df, seizures):
+    def _analyze_sleep_patterns(self, arrays, seizure_ns, col_stats):
         """Analyze sleep patterns before seizures"""
         print("\n3. SLEEP PATTERNS")
         print("-" * 60)
@@ -131,30 +214,21 @@ class TriggerAnalyzer:
         results = {}
         sleep_col = 'Sleep Analysis [Total] (hr)'
         
-        if sleep_col in df.columns:
-            # Get sleep data before seizures
-            sleep_before_seizure = []
-            for _, seizure in seizures.iterrows():
-                hour = seizure['DateTime'].floor('H')
-                # Get most recent sleep data (within 24 hours before)
-                recent_sleep = df[
-                    (df['DateTime'] >= hour - pd.Timedelta(hours=24)) & 
-                    (df['DateTime'] < hour)
-                ][sleep_col].dropna()
-                
-                if len(recent_sleep) > 0:
-                    sleep_before_seizure.append(recent_sleep.iloc[-1])
+        if sleep_col in arrays:
+            # Get most recent sleep data (within 24 hours before)
+            recent_sleep = self._pre_seizure(arrays, seizure_ns, arrays[sleep_col], 24, WINDOW_LAST)
+            sleep_before_seizure = recent_sleep[~np.isnan(recent_sleep)]
             
             # Compare to average sleep
-            avg_sleep = df[sleep_col].dropna().mean()
+            avg_sleep = col_stats[sleep_col]['mean']
             
             if len(sleep_before_seizure) > 0:
                 print(f"\nAverage sleep before seizures: {np.mean(sleep_before_seizure):.2f} hours")
                 print(f"Overall average sleep: {avg_sleep:.2f} hours")
                 
                 # Test if poor sleep is associated with seizures
-                poor_sleep_threshold = avg_sleep - df[sleep_col].std()
-                seizures_with_poor_sleep = sum(1 for s in sleep_before_seizure if s < poor_sleep_threshold)
+                poor_sleep_threshold = avg_sleep - col_stats[sleep_col]['std']
+                seizures_with_poor_sleep = int((sleep_before_seizure < poor_sleep_threshold).sum())
                 
                 print(f"Seizures preceded by poor sleep (<{poor_sleep_threshold:.1f}h): "
                       f"{seizures_with_poor_sleep}/{len(sleep_before_seizure)} "
@@ -169,35 +243,27 @@ class TriggerAnalyzer:
         
         return results
     
-    def _analyze_pain_patterns(self, df, seizures):
+    def _analyze_pain_patterns(self, arrays, seizure_ns, col_stats):
         """Analyze pain levels before seizures"""
         print("\n4. PAIN PATTERNS")
         print("-" * 60)
         
         results = {}
         
-        if 'Pain' in df.columns:
-            pain_before_seizure = []
-            for _, seizure in seizures.iterrows():
-                hour = seizure['DateTime'].floor('H')
-                # Get pain data 6 hours before
-                recent_pain = df[
-                    (df['DateTime'] >= hour - pd.Timedelta(hours=6)) & 
-                    (df['DateTime'] < hour)
-                ]['Pain'].dropna()
-                
-                if len(recent_pain) > 0:
-                    pain_before_seizure.append(recent_pain.mean())
+        if 'Pain' in arrays:
+            # Mean pain in the 6 hours before each seizure
+            recent_pain = self._pre_seizure(arrays, seizure_ns, arrays['Pain'], 6, WINDOW_MEAN)
+            pain_before_seizure = recent_pain[~np.isnan(recent_pain)]
             
-            avg_pain = df['Pain'].dropna().mean()
+            avg_pain = col_stats['Pain']['mean']
             
             if len(pain_before_seizure) > 0:
                 print(f"\nAverage pain before seizures: {np.mean(pain_before_seizure):.2f}")
                 print(f"Overall average pain: {avg_pain:.2f}")
                 
                 # High pain threshold
-                high_pain_threshold = avg_pain + df['Pain'].std()
-                seizures_with_high_pain = sum(1 for p in pain_before_seizure if p > high_pain_threshold)
+                high_pain_threshold = avg_pain + col_stats['Pain']['std']
+                seizures_with_high_pain = int((pain_before_seizure > high_pain_threshold).sum())
                 
                 print(f"Seizures preceded by high pain (>{high_pain_threshold:.1f}): "
                       f"{seizures_with_high_pain}/{len(pain_before_seizure)} "
@@ -212,7 +278,7 @@ class TriggerAnalyzer:
         
         return results
     
-    def _analyze_activity_patterns(self, df, seizures):
+    def _analyze_activity_patterns(self, arrays, seizure_ns, col_stats):
         """Analyze activity levels before seizures"""
         print("\n5. ACTIVITY PATTERNS")
         print("-" * 60)
@@ -220,19 +286,12 @@ class TriggerAnalyzer:
         results = {}
         activity_col = 'Walking + Running Distance (mi)'
         
-        if activity_col in df.columns:
-            activity_before_seizure = []
-            for _, seizure in seizures.iterrows():
-                hour = seizure['DateTime'].floor('H')
-                # Get activity in 6 hours before
-                recent_activity = df[
-                    (df['DateTime'] >= hour - pd.Timedelta(hours=6)) & 
-                    (df['DateTime'] < hour)
-                ][activity_col].dropna().sum()
-                
-                activity_before_seizure.append(recent_activity)
+        if activity_col in arrays:
+            # Total activity in the 6 hours before each seizure
+            activity_before_seizure = self._pre_seizure(
+                arrays, seizure_ns, arrays[activity_col], 6, WINDOW_SUM)
             
-            avg_activity = df[activity_col].dropna().mean() * 6  # 6 hour average
+            avg_activity = col_stats[activity_col]['mean'] * 6  # 6 hour average
             
             if len(activity_before_seizure) > 0:
                 print(f"\nAverage activity 6h before seizures: {np.mean(activity_before_seizure):.3f} miles")
@@ -245,6 +304,15 @@ class TriggerAnalyzer:
         
         return results
     
+    def _pre_seizure(self, arrays, seizure_ns, values, hours, op):
+        """
+        Reduce values over the `hours` before each seizure's hour
+        
+        arrays['DateTime'] must be sorted; values is aligned with it.
+        """
+        return _window_aggregate(arrays['DateTime'], values, seizure_ns,
+                                 hours * 3600 * 10**9, op)
+    
     def _analyze_food_patterns(self, seizures):
         """Analyze food consumption patterns"""
         print("\n6. FOOD PATTERNS")
@@ -256,17 +324,23 @@ class TriggerAnalyzer:
         print(f"\nSeizures with food eaten before: {len(eaten_data)}/{len(seizures)} "
               f"({len(eaten_data)/len(seizures)*100:.1f}%)")
         
-        # Food items mentioned
+        # Food items mentioned (comma-separated entries, case-insensitive)
+        food_counts = Counter()
         if len(eaten_data) > 0:
             foods = eaten_data['Food Eaten'].dropna()
-            print(f"\nFood items mentioned: {len(foods)}")
-            if len(foods) > 0:
+            food_counts = Counter(
+                item.strip().lower()
+                for entry in foods for item in entry.split(',') if item.strip()
+            )
+            print(f"\nFood items mentioned: {sum(food_counts.values())}")
+            if food_counts:
                 print("Foods consumed:")
-                for food in foods:
-                    print(f"  - {food}")
+                for food, count in food_counts.most_common(20):
+                    print(f"  - {food}: {count}")
         
         return {
             'seizures_with_food': len(eaten_data),
+            'food_counts': dict(food_counts),
             'total_seizures': len(seizures),
             'percentage': float(len(eaten_data)/len(seizures)*100) if len(seizures) > 0 else 0
         }
@@ -276,22 +350,22 @@ class TriggerAnalyzer:
         print("\n7. INTER-SEIZURE INTERVALS")
         print("-" * 60)
         
-        intervals = []
-        for i in range(1, len(seizures)):
-            interval = (seizures.iloc[i]['DateTime'] - seizures.iloc[i-1]['DateTime'])
-            intervals.append(interval.total_seconds() / 3600)  # Convert to hours
+        # Convert to hours
+        intervals = seizures['DateTime'].diff().dropna().dt.total_seconds().to_numpy() / 3600.0
         
         if len(intervals) > 0:
-            print(f"\nAverage time between seizures: {np.mean(intervals):.1f} hours ({np.mean(intervals)/24:.1f} days)")
-            print(f"Median time between seizures: {np.median(intervals):.1f} hours ({np.median(intervals)/24:.1f} days)")
-            print(f"Shortest interval: {np.min(intervals):.1f} hours")
-            print(f"Longest interval: {np.max(intervals):.1f} hours ({np.max(intervals)/24:.1f} days)")
+            mean_hours, median_hours, min_hours, max_hours = _interval_stats(intervals)
+            
+            print(f"\nAverage time between seizures: {mean_hours:.1f} hours ({mean_hours/24:.1f} days)")
+            print(f"Median time between seizures: {median_hours:.1f} hours ({median_hours/24:.1f} days)")
+            print(f"Shortest interval: {min_hours:.1f} hours")
+            print(f"Longest interval: {max_hours:.1f} hours ({max_hours/24:.1f} days)")
             
             return {
-                'mean_hours': float(np.mean(intervals)),
-                'median_hours': float(np.median(intervals)),
-                'min_hours': float(np.min(intervals)),
-                'max_hours': float(np.max(intervals))
+                'mean_hours': float(mean_hours),
+                'median_hours': float(median_hours),
+                'min_hours': float(min_hours),
+                'max_hours': float(max_hours)
             }
         
         return {}
@@ -299,8 +373,9 @@ class TriggerAnalyzer:
     def save_results(self, filepath='models/trigger_analysis.json'):
         """Save analysis results"""
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'w') as f:
-            json.dump(self.results, f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2 |
+                                 orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
         print(f"\nAnalysis results saved to {filepath}")
 
 def main():
@@ -0,0 +1,20 @@
+"""
+Data directory resolution for the prediction pipeline
+Kept free of heavy imports so scripts can locate the data cheaply
+"""
+
+import os
+
+# Resolve data directory paths
+SERVER_BASE_PATH = "/home/tristan/API/API_Repoed/THOR_API"
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(SCRIPT_DIR)
+
+# Determine which base path to use (check in priority order); the local
+# fallback may not exist yet, data_preprocessing creates it
+if os.path.exists(os.path.join(SERVER_BASE_PATH, "Data")):
+    BASE_DATA_DIR = os.path.join(SERVER_BASE_PATH, "Data")
+elif os.path.exists('/data/Data'):
+    BASE_DATA_DIR = '/data/Data'
+else:
+    BASE_DATA_DIR = os.path.join(PARENT_DIR, "Data")
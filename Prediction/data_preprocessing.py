@@ -8,21 +8,39 @@ import numpy as np
 from datetime import datetime, timedelta
 import os
 
-# Resolve data directory paths
-SERVER_BASE_PATH = "/home/tristan/API/API_Repoed/THOR_API"
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PARENT_DIR = os.path.dirname(SCRIPT_DIR)
+from data_paths import SCRIPT_DIR, PARENT_DIR, BASE_DATA_DIR
 
-# Determine which base path to use (check in priority order)
-if os.path.exists(os.path.join(SERVER_BASE_PATH, "Data")):
-    BASE_DATA_DIR = os.path.join(SERVER_BASE_PATH, "Data")
-elif os.path.exists('/data/Data'):
-    BASE_DATA_DIR = '/data/Data'
-elif os.path.exists(os.path.join(PARENT_DIR, "Data")):
-    BASE_DATA_DIR = os.path.join(PARENT_DIR, "Data")
-else:
-    BASE_DATA_DIR = os.path.join(PARENT_DIR, "Data")
-    os.makedirs(BASE_DATA_DIR, exist_ok=True)
+os.makedirs(BASE_DATA_DIR, exist_ok=True)
+
+# Timestamp layout shared by all CSV exports
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _newest_mtime_ns(paths):
+    """Latest modification time (ns) among the paths that exist"""
+    return max(os.stat(path).st_mtime_ns for path in paths if os.path.exists(path))
+
+def _read_stamped_parquet(cache_path, stamp):
+    """Cached frame if it was built from sources last modified at stamp, else None"""
+    if os.path.exists(cache_path) and os.stat(cache_path).st_mtime_ns == stamp:
+        try:
+            return pd.read_parquet(cache_path)
+        except (ImportError, OSError, ValueError):
+            pass
+    return None
+
+def _write_stamped_parquet(df, cache_path, stamp):
+    """
+    Atomically write df as a Parquet cache whose mtime is stamp, the
+    sources' mtime captured before building it; a source modified while
+    building (e.g. a row appended by the API) leaves the cache stale
+    """
+    try:
+        tmp_path = cache_path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.utime(tmp_path, ns=(stamp, stamp))
+        os.replace(tmp_path, cache_path)
+    except (ImportError, OSError, ValueError):
+        pass
 
 class DataLoader:
     def __init__(self, data_folder=None):
@@ -31,19 +49,93 @@ class DataLoader:
         else:
             self.data_folder = data_folder
         
+    def _load_cached(self, filename, parse):
+        """
+        Load a CSV through its parse function, caching the parsed result
+        as Parquet next to the CSV. The cache is reused until the CSV or
+        this module (with the parse functions) is modified again; without
+        a Parquet engine the CSV is parsed every time.
+        """
+        csv_path = os.path.join(self.data_folder, filename)
+        cache_path = csv_path + '.parquet'
+        newest = _newest_mtime_ns([csv_path, __file__])
+        
+        df = _read_stamped_parquet(cache_path, newest)
+        if df is None:
+            df = parse(csv_path)
+            _write_stamped_parquet(df, cache_path, newest)
+        
+        return df
+    
+    def _feature_cache_sources(self):
+        """Files the cached hourly features are derived from: the CSVs and the pipeline code"""
+        sources = [os.path.join(self.data_folder, name)
+                   for name in ('seizures.csv', 'appleWatchData.csv', 'pain.csv')]
+        sources += [os.path.join(SCRIPT_DIR, name) for name in
+                    ('data_preprocessing.py', 'feature_engineering.py', 'prediction_feedback.py')]
+        return sources
+    
+    def feature_sources(self):
+        """
+        Files the output of load_features is derived from: the cache
+        sources plus the prediction log read for feedback features
+        """
+        return self._feature_cache_sources() + [
+            os.path.join(PARENT_DIR, 'Data', 'longTermPredictions.json')]
+    
+    def load_features(self, engineer):
+        """
+        Hourly dataset passed through the engineer's create_features, with
+        prediction feedback features added. The engineered features are
+        cached as Parquet in the data folder and reused until a CSV or the
+        pipeline code is modified; the feedback features follow the
+        prediction log, which grows every prediction run, so they are
+        attached after the cache
+        
+        Returns:
+            df_features, seizures
+        """
+        cache_path = os.path.join(self.data_folder, 'hourly_features.parquet')
+        newest = _newest_mtime_ns(self._feature_cache_sources())
+        
+        df_features = _read_stamped_parquet(cache_path, newest)
+        if df_features is not None:
+            seizures = self.load_seizures()
+        else:
+            df, seizures = self.create_hourly_dataset()
+            df_features = engineer.create_features(df)
+            _write_stamped_parquet(df_features, cache_path, newest)
+        
+        df_features = self._add_prediction_feedback_features(df_features, seizures)
+        return engineer.add_feedback_engineered_features(df_features), seizures
+    
     def load_seizures(self):
         """Load and preprocess seizure data"""
-        df = pd.read_csv(os.path.join(self.data_folder, 'seizures.csv'))
+        return self._load_cached('seizures.csv', self._parse_seizures)
+    
+    def load_apple_watch_data(self):
+        """Load and preprocess Apple Watch data"""
+        return self._load_cached('appleWatchData.csv', self._parse_apple_watch_data)
+    
+    def load_pain_data(self):
+        """Load and preprocess pain data"""
+        return self._load_cached('pain.csv', self._parse_pain_data)
+    
+    def _parse_seizures(self, path):
+        """Parse and clean seizures.csv"""
+        df = pd.read_csv(path)
         
         # Combine Date and Time
-        df['DateTime'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
+        df['DateTime'] = pd.to_datetime(df['Date'] + ' ' + df['Time'], format=DATETIME_FORMAT)
         
         # Clean Duration column (remove non-numeric values)
         df['Duration'] = pd.to_numeric(df['Duration'], errors='coerce')
         
-        # Convert boolean columns
-        df['Peiod'] = df['Peiod'].map({'True': True, 'False': False, 'NULL': None})
-        df['Eaten'] = df['Eaten'].map({'True': True, 'False': False, 'NULL': None})
+        # Convert boolean columns (read_csv may already have parsed them to
+        # bool, so compare on the string form; anything else becomes NA)
+        for col in ['Peiod', 'Eaten']:
+            raw = df[col].astype('string')
+            df[col] = raw.eq('True').astype('boolean').mask(~raw.isin(['True', 'False']))
         
         # Fill Food Eaten nulls
         df['Food Eaten'] = df['Food Eaten'].fillna('')
@@ -51,17 +143,8 @@ class DataLoader:
         df = df.sort_values('DateTime').reset_index(drop=True)
         return df
     
-    def load_apple_watch_data(self):
-        """Load and preprocess Apple Watch data"""
-        df = pd.read_csv(os.path.join(self.data_folder, 'appleWatchData.csv'))
-        
-        # Parse datetime
-        df['DateTime'] = pd.to_datetime(df['Date/Time'])
-        
-        # Drop original date column
-        df = df.drop('Date/Time', axis=1)
-        
-        # Clean numeric columns
+    def _parse_apple_watch_data(self, path):
+        """Parse and clean appleWatchData.csv"""
         numeric_cols = ['Heart Rate [Min] (count/min)', 'Heart Rate [Max] (count/min)', 
                        'Heart Rate [Avg] (count/min)', 'Sleep Analysis [Total] (hr)',
                        'Sleep Analysis [Asleep] (hr)', 'Sleep Analysis [In Bed] (hr)',
@@ -69,21 +152,35 @@ class DataLoader:
                        'Sleep Analysis [REM] (hr)', 'Sleep Analysis [Awake] (hr)',
                        'Walking + Running Distance (mi)']
         
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+        # Parse datetime and numeric columns (as float32) while reading
+        read_options = dict(usecols=['Date/Time'] + numeric_cols, na_values=['', 'NULL'],
+                            parse_dates=['Date/Time'], date_format=DATETIME_FORMAT)
+        try:
+            df = pd.read_csv(path, dtype={col: np.float32 for col in numeric_cols},
+                             **read_options)
+        except ValueError:
+            # Uploaded exports can hold non-numeric cells (e.g. '--'); read
+            # those columns as text and turn anything unparseable into NaN
+            df = pd.read_csv(path, dtype={col: str for col in numeric_cols}, **read_options)
+            df[numeric_cols] = df[numeric_cols].apply(
+                pd.to_numeric, errors='coerce').astype(np.float32)
         
-        df = df.sort_values('DateTime').reset_index(drop=True)
+        # Move the parsed date column to the end as DateTime
+        df['DateTime'] = df.pop('Date/Time')
+        
+        # Stable sort keeps repeated hours in file order
+        df = df.sort_values('DateTime', kind='stable').reset_index(drop=True)
         return df
     
-    def load_pain_data(self):
-        """Load and preprocess pain data"""
-        df = pd.read_csv(os.path.join(self.data_folder, 'pain.csv'))
+    def _parse_pain_data(self, path):
+        """Parse and clean pain.csv"""
+        df = pd.read_csv(path)
         
         # Strip whitespace from column names (handles CSV formatting issues)
         df.columns = df.columns.str.strip()
         
         # Combine Date and Time
-        df['DateTime'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
+        df['DateTime'] = pd.to_datetime(df['Date'] + ' ' + df['Time'], format=DATETIME_FORMAT)
         
         # Clean pain column
         df['Pain'] = pd.to_numeric(df['Pain'], errors='coerce')
@@ -119,28 +216,34 @@ class DataLoader:
         # Create base dataframe
         df = pd.DataFrame({'DateTime': date_range})
         
+        # Locate the hourly row of every seizure in one lookup
+        seizure_rows = date_range.get_indexer(seizures['DateTime'].dt.floor('H'))
+        valid = seizure_rows >= 0
+        
         # Add seizure indicator (1 if seizure occurred in that hour)
-        df['seizure'] = 0
-        for _, seizure in seizures.iterrows():
-            hour = seizure['DateTime'].floor('H')
-            df.loc[df['DateTime'] == hour, 'seizure'] = 1
+        df['seizure'] = np.int8(0)
+        df.iloc[seizure_rows[valid], df.columns.get_loc('seizure')] = 1
             
-        # Add seizure duration
-        df['seizure_duration'] = 0
-        for _, seizure in seizures.iterrows():
-            hour = seizure['DateTime'].floor('H')
-            df.loc[df['DateTime'] == hour, 'seizure_duration'] = seizure['Duration']
+        # Add seizure duration (last seizure wins when an hour has several)
+        df['seizure_duration'] = np.float32(0)
+        df.iloc[seizure_rows[valid], df.columns.get_loc('seizure_duration')] = \
+            seizures['Duration'].to_numpy()[valid]
         
-        # Merge Apple Watch data
-        df = df.merge(apple_watch, on='DateTime', how='left')
+        # Align Apple Watch readings onto the hourly grid. Overlapping
+        # exports can repeat an hour; the latest row for it is kept.
+        watch = apple_watch.drop_duplicates('DateTime', keep='last').set_index('DateTime')
+        watch = watch.reindex(date_range)
         
-        # Add pain data (forward fill within 24 hours)
-        pain_hourly = pain.copy()
-        pain_hourly['DateTime'] = pain_hourly['DateTime'].dt.floor('H')
-        df = df.merge(pain_hourly[['DateTime', 'Pain']], on='DateTime', how='left')
+        # Add pain data: last observation carried forward, max 24 hours.
+        # Several entries in one hour resolve to the latest of them.
+        pain_hourly = pain.loc[pain['Pain'].notna(), ['DateTime', 'Pain']]
+        pain_hourly = pain_hourly.assign(DateTime=pain_hourly['DateTime'].dt.floor('H'))
+        pain_hourly = pain_hourly.drop_duplicates('DateTime', keep='last').set_index('DateTime')
+        pain_hourly = pain_hourly.reindex(date_range, method='ffill',
+                                          tolerance=pd.Timedelta(hours=24))
         
-        # Forward fill pain data (last observation carried forward, max 24 hours)
-        df['Pain'] = df['Pain'].fillna(method='ffill', limit=24)
+        df = pd.concat([df, watch.reset_index(drop=True),
+                        pain_hourly.reset_index(drop=True)], axis=1)
         
         # Add prediction feedback features if requested
         if include_feedback_features:
@@ -164,29 +267,33 @@ class DataLoader:
             pred_features = feedback.create_prediction_features()
             
             if len(pred_features) > 0:
-                # Merge feedback features on nearest timestamp
-                pred_features = pred_features.rename(columns={'DateTime': 'PredDateTime'})
+                feedback_cols = ['recent_pred_24h_avg', 'recent_pred_24h_std', 
+                                 'recent_pred_48h_avg', 'recent_pred_48h_std',
+                                 'prediction_trend_24h', 'recent_prediction_variance',
+                                 'hours_since_last_prediction', 'confidence_spike']
+                
+                # For each prediction, find the closest hour in df (ties and
+                # duplicate hours resolve to the earliest row)
+                hours = pd.DataFrame({'DateTime': df['DateTime'], 'row': np.arange(len(df))})
+                hours = hours.drop_duplicates('DateTime', keep='first')
+                nearest = pd.merge_asof(
+                    pred_features.sort_values('DateTime'), hours,
+                    on='DateTime', direction='nearest'
+                )
                 
-                # For each hour in df, find the nearest prediction
-                for col in ['recent_pred_24h_avg', 'recent_pred_24h_std', 
-                           'recent_pred_48h_avg', 'recent_pred_48h_std',
-                           'prediction_trend_24h', 'recent_prediction_variance',
-                           'hours_since_last_prediction', 'confidence_spike']:
-                    df[col] = np.nan
+                # Later predictions overwrite earlier ones at the same hour,
+                # but only with non-missing values
+                per_hour = nearest.groupby('row')[feedback_cols].last()
                 
-                for idx, pred_row in pred_features.iterrows():
-                    pred_time = pred_row['PredDateTime']
-                    # Find closest hour in df
-                    closest_idx = (df['DateTime'] - pred_time).abs().argmin()
-                    
-                    for col in pred_features.columns:
-                        if col != 'PredDateTime' and pd.notna(pred_row[col]):
-                            df.loc[closest_idx, col] = pred_row[col]
+                # Write every matched row positionally into one block
+                feedback_values = np.full((len(df), len(feedback_cols)), np.nan)
+                feedback_values[per_hour.index.to_numpy()] = per_hour.to_numpy()
+                df[feedback_cols] = feedback_values
                 
                 # Forward fill these features (they apply to all hours following the prediction)
-                for col in ['recent_pred_24h_avg', 'recent_pred_24h_std', 
-                           'recent_pred_48h_avg', 'recent_pred_48h_std']:
-                    df[col] = df[col].fillna(method='ffill', limit=24)
+                ffill_cols = ['recent_pred_24h_avg', 'recent_pred_24h_std', 
+                              'recent_pred_48h_avg', 'recent_pred_48h_std']
+                df[ffill_cols] = df[ffill_cols].ffill(limit=24)
                 
                 print("[OK] Added prediction feedback features")
         
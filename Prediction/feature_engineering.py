@@ -6,6 +6,45 @@ Creates temporal, physiological, and historical features
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from numba import njit
+
+# Cyclical encodings take only 24 (hour) and 7 (weekday) distinct values,
+# so they are looked up from tables instead of recomputed per row
+HOUR_SIN = np.sin(2 * np.pi * np.arange(24) / 24)
+HOUR_COS = np.cos(2 * np.pi * np.arange(24) / 24)
+DOW_SIN = np.sin(2 * np.pi * np.arange(7) / 7)
+DOW_COS = np.cos(2 * np.pi * np.arange(7) / 7)
+
+@njit(cache=True)
+def _hours_since_last_seizure(seizure):
+    """Rows since the previous seizure row (-1 before the first seizure)"""
+    hours = np.empty(len(seizure), dtype=np.int64)
+    last = -1
+    for i in range(len(seizure)):
+        hours[i] = -1 if last < 0 else i - last
+        if seizure[i]:
+            last = i
+    return hours
+
+@njit(cache=True)
+def _seizure_targets(seizure, horizon):
+    """
+    Training targets in one backward pass: whether a seizure falls in the
+    horizon starting at each row, and hours until the next later seizure
+    (horizon + 1 when none is within the horizon)
+    """
+    n = len(seizure)
+    target_seizure = np.zeros(n, dtype=np.int64)
+    target_hours = np.empty(n, dtype=np.int64)
+    next_seizure = n
+    for i in range(n - 1, -1, -1):
+        gap = next_seizure - i
+        target_hours[i] = gap if gap <= horizon else horizon + 1
+        if seizure[i]:
+            next_seizure = i
+        if next_seizure - i < horizon:
+            target_seizure[i] = 1
+    return target_seizure, target_hours
 
 class FeatureEngineer:
     def __init__(self):
@@ -14,9 +53,8 @@ class FeatureEngineer:
     def create_features(self, df):
         """
         Create comprehensive features for seizure prediction
+        (each step returns a new frame, so the caller's df is left untouched)
         """
-        df = df.copy()
-        
         # Temporal features
         df = self._add_temporal_features(df)
         
@@ -36,110 +74,136 @@ class FeatureEngineer:
         df = self._add_sleep_features(df)
         
         # Prediction feedback features (if available)
-        df = self._add_feedback_engineered_features(df)
+        df = self.add_feedback_engineered_features(df)
         
         return df
     
+    def _append_columns(self, df, columns):
+        """Add a dict of new feature columns to df in one concat (floats stored as float32)"""
+        if not columns:
+            return df
+        columns = {name: values.astype(np.float32) if values.dtype == np.float64 else values
+                   for name, values in columns.items()}
+        return pd.concat([df, pd.DataFrame(columns, index=df.index)], axis=1)
+    
+    def _build_per_column(self, build, df, cols):
+        """
+        Run build(col, values) for each of cols present in df and merge
+        the returned column dicts in order
+        """
+        features = {}
+        for col in cols:
+            if col in df.columns:
+                features.update(build(col, df[col]))
+        return features
+    
     def _add_temporal_features(self, df):
         """Add time-based features"""
-        df['hour'] = df['DateTime'].dt.hour
-        df['day_of_week'] = df['DateTime'].dt.dayofweek
-        df['day_of_month'] = df['DateTime'].dt.day
-        df['month'] = df['DateTime'].dt.month
-        df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
+        dt = df['DateTime'].dt
+        hour = dt.hour.to_numpy()
+        day_of_week = dt.dayofweek.to_numpy()
+        
+        features = {
+            'hour': hour,
+            'day_of_week': day_of_week,
+            'day_of_month': dt.day.to_numpy(),
+            'month': dt.month.to_numpy(),
+            'is_weekend': (day_of_week >= 5).astype(np.int8),
+        }
         
         # Cyclical encoding for time of day
-        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
+        features['hour_sin'] = HOUR_SIN[hour]
+        features['hour_cos'] = HOUR_COS[hour]
         
         # Cyclical encoding for day of week
-        df['dow_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
-        df['dow_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+        features['dow_sin'] = DOW_SIN[day_of_week]
+        features['dow_cos'] = DOW_COS[day_of_week]
         
-        return df
+        return self._append_columns(df, features)
     
     def _add_seizure_history_features(self, df):
         """Add features based on seizure history"""
-        # Hours since last seizure
-        df['hours_since_last_seizure'] = 0
-        last_seizure_idx = None
-        
-        for idx, row in df.iterrows():
-            if last_seizure_idx is not None:
-                hours_diff = (idx - last_seizure_idx)
-                df.loc[idx, 'hours_since_last_seizure'] = hours_diff
-            else:
-                df.loc[idx, 'hours_since_last_seizure'] = -1
-                
-            if row['seizure'] == 1:
-                last_seizure_idx = idx
+        features = {}
+        
+        # Hours since last seizure (a seizure hour counts from the previous
+        # seizure; -1 until the first seizure has been seen)
+        hours_since = pd.Series(_hours_since_last_seizure(df['seizure'].to_numpy() == 1),
+                                index=df.index)
+        features['hours_since_last_seizure'] = hours_since
         
         # Number of seizures in past N hours
         for window in [24, 48, 72, 168]:  # 1 day, 2 days, 3 days, 1 week
-            df[f'seizures_past_{window}h'] = df['seizure'].rolling(
+            features[f'seizures_past_{window}h'] = df['seizure'].rolling(
                 window=window, min_periods=1).sum()
         
         # Average time between seizures (rolling window)
-        df['avg_time_between_seizures'] = df['hours_since_last_seizure'].rolling(
+        features['avg_time_between_seizures'] = hours_since.rolling(
             window=168, min_periods=1).mean()
         
-        return df
+        return self._append_columns(df, features)
     
     def _add_physiological_features(self, df):
         """Add heart rate and physiological features"""
         hr_cols = ['Heart Rate [Min] (count/min)', 
                    'Heart Rate [Max] (count/min)', 
                    'Heart Rate [Avg] (count/min)']
-        
-        for col in hr_cols:
-            if col in df.columns:
-                # Rolling statistics
-                for window in [6, 12, 24]:  # 6h, 12h, 24h
-                    df[f'{col}_rolling_mean_{window}h'] = df[col].rolling(
-                        window=window, min_periods=1).mean()
-                    df[f'{col}_rolling_std_{window}h'] = df[col].rolling(
-                        window=window, min_periods=1).std()
+        features = self._build_per_column(self._heart_rate_columns, df, hr_cols)
         
         # Heart rate variability proxy
         if 'Heart Rate [Max] (count/min)' in df.columns and 'Heart Rate [Min] (count/min)' in df.columns:
-            df['hr_range'] = df['Heart Rate [Max] (count/min)'] - df['Heart Rate [Min] (count/min)']
-            df['hr_range_rolling_mean_12h'] = df['hr_range'].rolling(
+            hr_range = df['Heart Rate [Max] (count/min)'] - df['Heart Rate [Min] (count/min)']
+            features['hr_range'] = hr_range
+            features['hr_range_rolling_mean_12h'] = hr_range.rolling(
                 window=12, min_periods=1).mean()
         
-        return df
+        return self._append_columns(df, features)
+    
+    def _heart_rate_columns(self, col, values):
+        """Rolling statistics for one heart rate column"""
+        features = {}
+        for window in [6, 12, 24]:  # 6h, 12h, 24h
+            rolling = values.rolling(window=window, min_periods=1).agg(['mean', 'std'])
+            features[f'{col}_rolling_mean_{window}h'] = rolling['mean']
+            features[f'{col}_rolling_std_{window}h'] = rolling['std']
+        return features
     
     def _add_pain_features(self, df):
         """Add pain-related features"""
+        features = {}
+        
         if 'Pain' in df.columns:
+            pain = df['Pain']
+            
             # Rolling pain statistics
             for window in [6, 12, 24, 48]:
-                df[f'pain_rolling_mean_{window}h'] = df['Pain'].rolling(
-                    window=window, min_periods=1).mean()
-                df[f'pain_rolling_max_{window}h'] = df['Pain'].rolling(
-                    window=window, min_periods=1).max()
+                rolling = pain.rolling(window=window, min_periods=1).agg(['mean', 'max'])
+                features[f'pain_rolling_mean_{window}h'] = rolling['mean']
+                features[f'pain_rolling_max_{window}h'] = rolling['max']
             
             # Pain change rate
-            df['pain_change'] = df['Pain'].diff()
-            df['pain_increasing'] = (df['pain_change'] > 0).astype(int)
+            pain_change = pain.diff()
+            features['pain_change'] = pain_change
+            features['pain_increasing'] = (pain_change > 0).astype(np.int8)
         
-        return df
+        return self._append_columns(df, features)
     
     def _add_activity_features(self, df):
         """Add activity/movement features"""
+        features = {}
+        
         if 'Walking + Running Distance (mi)' in df.columns:
-            dist_col = 'Walking + Running Distance (mi)'
+            distance = df['Walking + Running Distance (mi)']
             
             # Rolling activity statistics
             for window in [6, 12, 24]:
-                df[f'activity_sum_{window}h'] = df[dist_col].rolling(
-                    window=window, min_periods=1).sum()
-                df[f'activity_mean_{window}h'] = df[dist_col].rolling(
-                    window=window, min_periods=1).mean()
+                rolling = distance.rolling(window=window, min_periods=1).agg(['sum', 'mean'])
+                features[f'activity_sum_{window}h'] = rolling['sum']
+                features[f'activity_mean_{window}h'] = rolling['mean']
             
             # Activity change
-            df['activity_change'] = df[dist_col].diff()
+            features['activity_change'] = distance.diff()
         
-        return df
+        return self._append_columns(df, features)
     
     def _add_sleep_features(self, df):
         """Add sleep-related features"""
@@ -147,27 +211,31 @@ class FeatureEngineer:
                      'Sleep Analysis [Deep] (hr)',
                      'Sleep Analysis [REM] (hr)',
                      'Sleep Analysis [Awake] (hr)']
-        
-        for col in sleep_cols:
-            if col in df.columns:
-                # Most recent sleep data (forward fill up to 24 hours)
-                df[f'{col}_recent'] = df[col].fillna(method='ffill', limit=24)
-                
-                # Rolling average of sleep
-                df[f'{col}_7day_avg'] = df[col].rolling(
-                    window=168, min_periods=1).mean()
+        features = self._build_per_column(self._sleep_columns, df, sleep_cols)
         
         # Sleep quality indicators
         if 'Sleep Analysis [Total] (hr)' in df.columns and 'Sleep Analysis [Deep] (hr)' in df.columns:
-            df['deep_sleep_ratio'] = df['Sleep Analysis [Deep] (hr)'] / (
+            features['deep_sleep_ratio'] = df['Sleep Analysis [Deep] (hr)'] / (
                 df['Sleep Analysis [Total] (hr)'] + 0.01)  # Avoid division by zero
         
-        return df
+        return self._append_columns(df, features)
     
-    def _add_feedback_engineered_features(self, df):
+    def _sleep_columns(self, col, values):
+        """Recent and weekly-average features for one sleep column"""
+        return {
+            # Most recent sleep data (forward fill up to 24 hours)
+            f'{col}_recent': values.ffill(limit=24),
+            
+            # Rolling average of sleep
+            f'{col}_7day_avg': values.rolling(window=168, min_periods=1).mean(),
+        }
+    
+    def add_feedback_engineered_features(self, df):
         """
         Engineer features from prediction feedback history
         These help the model learn from past prediction patterns
+        (public so feedback columns attached after create_features,
+        as DataLoader.load_features does, can be derived too)
         """
         feedback_cols = [
             'recent_pred_24h_avg', 'recent_pred_24h_std',
@@ -182,29 +250,33 @@ class FeatureEngineer:
         if not available_feedback_cols:
             return df
         
+        features = {}
+        
         # Create derived features from feedback
         if 'recent_pred_24h_avg' in df.columns:
             # Prediction confidence level (std indicates uncertainty)
-            df['prediction_confidence'] = 1.0 / (1.0 + df['recent_pred_24h_std'].fillna(0))
+            features['prediction_confidence'] = 1.0 / (1.0 + df['recent_pred_24h_std'].fillna(0))
             
             # How extreme is current prediction context relative to recent?
-            df['prediction_anomaly'] = (
+            features['prediction_anomaly'] = (
                 df['recent_pred_24h_avg'] - df['recent_pred_24h_avg'].mean()
             ) / (df['recent_pred_24h_std'].fillna(1) + 0.01)
         
         if 'confidence_spike' in df.columns:
             # Rapid changes in confidence might indicate changing conditions
-            df['confidence_momentum'] = df['confidence_spike'].rolling(
+            features['confidence_momentum'] = df['confidence_spike'].rolling(
                 window=6, min_periods=1).mean()
         
         if 'prediction_trend_24h' in df.columns:
             # Is risk increasing or decreasing?
-            df['risk_trajectory'] = np.sign(df['prediction_trend_24h'])
+            features['risk_trajectory'] = np.sign(df['prediction_trend_24h'])
         
-        # Fill NaN values in feedback features with defaults
-        for col in available_feedback_cols:
-            if col in df.columns:
-                df[col] = df[col].fillna(df[col].median() if df[col].median() > 0 else 0)
+        df = self._append_columns(df, features)
+        
+        # Fill NaN values in feedback features with defaults (the column
+        # median when it is positive, otherwise 0)
+        medians = df[available_feedback_cols].median()
+        df[available_feedback_cols] = df[available_feedback_cols].fillna(medians.where(medians > 0, 0))
         
         return df
     
@@ -221,34 +293,23 @@ class FeatureEngineer:
             y_classification: Binary target (seizure in next N hours)
             y_regression: Hours until next seizure
         """
-        df = df.copy()
-        
         # Create target variables
         # Classification: Will there be a seizure in the next prediction_horizon hours?
-        df['target_seizure'] = 0
-        for i in range(len(df)):
-            future_seizures = df.iloc[i:i+prediction_horizon]['seizure'].sum()
-            df.loc[df.index[i], 'target_seizure'] = 1 if future_seizures > 0 else 0
-        
-        # Regression: Hours until next seizure
-        df['target_hours_to_seizure'] = prediction_horizon + 1
-        for i in range(len(df)):
-            for j in range(i+1, min(i+prediction_horizon+1, len(df))):
-                if df.iloc[j]['seizure'] == 1:
-                    df.loc[df.index[i], 'target_hours_to_seizure'] = j - i
-                    break
-        
-        # Remove rows where we can't predict (too close to end of data)
-        df = df.iloc[:-prediction_horizon]
+        # (window of prediction_horizon hours starting at the current one)
+        # Regression: Hours until next seizure (strictly after the current hour)
+        target_seizure, target_hours = _seizure_targets(df['seizure'].to_numpy() == 1,
+                                                        prediction_horizon)
         
         # Select features (exclude targets, datetime, and raw identifiers)
         exclude_cols = ['DateTime', 'seizure', 'seizure_duration', 
                        'target_seizure', 'target_hours_to_seizure']
         feature_cols = [col for col in df.columns if col not in exclude_cols]
         
-        X = df[feature_cols]
-        y_classification = df['target_seizure']
-        y_regression = df['target_hours_to_seizure']
+        # Remove rows where we can't predict (too close to end of data)
+        keep = slice(None, -prediction_horizon)
+        X = df[feature_cols].iloc[keep]
+        y_classification = pd.Series(target_seizure[keep], index=X.index, name='target_seizure')
+        y_regression = pd.Series(target_hours[keep], index=X.index, name='target_hours_to_seizure')
         
         return X, y_classification, y_regression, feature_cols
 
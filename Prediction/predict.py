@@ -6,51 +6,56 @@ Uses trained models to predict seizure risk
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import json
+import orjson
 import os
 import pytz
 
-from data_preprocessing import DataLoader
-from feature_engineering import FeatureEngineer
+from data_preprocessing import DataLoader, BASE_DATA_DIR
+from feature_engineering import FeatureEngineer, HOUR_SIN, HOUR_COS, DOW_SIN, DOW_COS
 from train_model import SeizurePredictor
 
-# Resolve data directory paths
-SERVER_BASE_PATH = "/home/tristan/API/API_Repoed/THOR_API"
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PARENT_DIR = os.path.dirname(SCRIPT_DIR)
-
-# Determine which base path to use (check in priority order)
-if os.path.exists(os.path.join(SERVER_BASE_PATH, "Data")):
-    BASE_DATA_DIR = os.path.join(SERVER_BASE_PATH, "Data")
-elif os.path.exists('/data/Data'):
-    BASE_DATA_DIR = '/data/Data'
-elif os.path.exists(os.path.join(PARENT_DIR, "Data")):
-    BASE_DATA_DIR = os.path.join(PARENT_DIR, "Data")
-else:
-    BASE_DATA_DIR = os.path.join(PARENT_DIR, "Data")
-    os.makedirs(BASE_DATA_DIR, exist_ok=True)
-
 # Set prediction file paths
 PREDICTION_TXT = os.path.join(BASE_DATA_DIR, "prediction.txt")
 LONG_TERM_JSON = os.path.join(BASE_DATA_DIR, "longTermPredictions.json")
 
+# Risk levels by probability: below 0.2 is Low, 0.2 up to 0.4 Moderate, ...
+RISK_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.8])
+RISK_LEVELS = np.array(['Low', 'Moderate', 'Elevated', 'High', 'Very High'], dtype=object)
+
 class SeizureForecaster:
     def __init__(self, model_path='models'):
         self.predictor = SeizurePredictor()
         self.predictor.load_model(model_path)
         self.engineer = FeatureEngineer()
         self.loader = DataLoader()
+        self._data = None
+        self._data_key = None
+    
+    def _load_data(self):
+        """
+        Load engineered features (with feedback features) and seizures.
+        The loader keeps the features cached as Parquet across runs; they are
+        also kept in memory until one of the source files is modified
+        """
+        key = tuple(os.path.getmtime(path) if os.path.exists(path) else None
+                    for path in self.loader.feature_sources())
         
+        if self._data is None or key != self._data_key:
+            self._data = self.loader.load_features(self.engineer)
+            self._data_key = key
+        return self._data
+    
     def get_current_prediction(self):
         """
         Get prediction for current time
         """
-        # Load latest data with feedback features
-        df, seizures = self.loader.create_hourly_dataset(include_feedback_features=True)
-        
-        # Create features
-        df_features = self.engineer.create_features(df)
+        # Load latest data and features
+        df_features, seizures = self._load_data()
         
+        return self._predict_from_features(df_features)
+    
+    def _predict_from_features(self, df_features):
+        """Predict for the most recent hour of already engineered features"""
         # Get the most recent hour
         latest_data = df_features.iloc[-1:]
         
@@ -63,7 +68,7 @@ class SeizureForecaster:
         predictions = self.predictor.predict(X)
         
         result = {
-            'timestamp': latest_data['DateTime'].iloc[0].strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': df_features['DateTime'].iloc[-1].strftime('%Y-%m-%d %H:%M:%S'),
             'seizure_probability': float(predictions['seizure_probability'][0]),
             'predicted_hours_to_seizure': float(predictions['predicted_hours_to_seizure'][0]),
             'risk_level': self._get_risk_level(predictions['seizure_probability'][0])
@@ -75,109 +80,81 @@ class SeizureForecaster:
         """
         Get forecast for next N hours
         """
-        # Load latest data with feedback features
-        df, seizures = self.loader.create_hourly_dataset(include_feedback_features=True)
-        df_features = self.engineer.create_features(df)
+        # Load latest data and features
+        df_features, seizures = self._load_data()
         
         # Create future datetime range starting from now
         now = pd.Timestamp.now().floor('H')
         future_datetimes = pd.date_range(start=now, periods=hours_ahead, freq='H')
         
-        # Create a dataframe with future datetimes
-        forecast_df = pd.DataFrame({'DateTime': future_datetimes})
-        
-        # Get the most recent hour's data as a template
-        latest_data = df_features.iloc[-1:].copy()
-        
-        # For each future hour, we'll create a row based on the pattern
-        # We'll use the average of the last 24 hours for physiological features
-        last_24_data = df_features.iloc[-24:]
+        # Select only the feature columns used in training
+        exclude_cols = ['DateTime', 'seizure', 'seizure_duration']
+        feature_cols = [col for col in df_features.columns if col not in exclude_cols]
         
-        forecast_rows = []
-        for future_dt in future_datetimes:
-            # Start with the latest row and update DateTime
-            row = latest_data.iloc[0].copy()
-            row['DateTime'] = future_dt
-            
-            # Update temporal features
-            row['hour'] = future_dt.hour
-            row['day_of_week'] = future_dt.dayofweek
-            row['day_of_month'] = future_dt.day
-            row['month'] = future_dt.month
-            row['is_weekend'] = 1 if future_dt.dayofweek >= 5 else 0
-            row['hour_sin'] = np.sin(2 * np.pi * future_dt.hour / 24)
-            row['hour_cos'] = np.cos(2 * np.pi * future_dt.hour / 24)
-            row['dow_sin'] = np.sin(2 * np.pi * future_dt.dayofweek / 7)
-            row['dow_cos'] = np.cos(2 * np.pi * future_dt.dayofweek / 7)
-            
-            # Update seizure history features
-            if len(seizures) > 0:
-                last_seizure_time = seizures.iloc[-1]['DateTime']
-                row['hours_since_last_seizure'] = (future_dt - last_seizure_time).total_seconds() / 3600
-            
-            # Seizure counts remain constant for the forecast
-            for col in row.index:
-                if 'seizures_past_' in col:
-                    # These stay the same from the last known data
-                    row[col] = latest_data.iloc[0][col]
-            
-            forecast_rows.append(row)
+        col_idx = {col: i for i, col in enumerate(feature_cols)}
         
-        forecast_df = pd.DataFrame(forecast_rows)
+        # Every future hour starts from the most recent hour's features
+        # (seizure counts and physiological values stay as last observed)
+        latest_row = df_features.iloc[-1:][feature_cols].to_numpy(dtype=np.float32)
+        buffer = np.empty((hours_ahead, len(feature_cols)), dtype=np.float32)
+        buffer[:] = latest_row
         
-        # Select only the feature columns used in training
-        exclude_cols = ['DateTime', 'seizure', 'seizure_duration']
-        feature_cols = [col for col in df_features.columns if col not in exclude_cols and col in forecast_df.columns]
+        # Update temporal features for all hours at once
+        hour = future_datetimes.hour.to_numpy()
+        day_of_week = future_datetimes.dayofweek.to_numpy()
+        buffer[:, col_idx['hour']] = hour
+        buffer[:, col_idx['day_of_week']] = day_of_week
+        buffer[:, col_idx['day_of_month']] = future_datetimes.day.to_numpy()
+        buffer[:, col_idx['month']] = future_datetimes.month.to_numpy()
+        buffer[:, col_idx['is_weekend']] = day_of_week >= 5
+        buffer[:, col_idx['hour_sin']] = HOUR_SIN[hour]
+        buffer[:, col_idx['hour_cos']] = HOUR_COS[hour]
+        buffer[:, col_idx['dow_sin']] = DOW_SIN[day_of_week]
+        buffer[:, col_idx['dow_cos']] = DOW_COS[day_of_week]
         
-        X = forecast_df[feature_cols].copy()
+        # Update seizure history features
+        if len(seizures) > 0:
+            last_seizure_time = seizures['DateTime'].iloc[-1]
+            buffer[:, col_idx['hours_since_last_seizure']] = \
+                (future_datetimes - last_seizure_time).total_seconds() / 3600
         
-        # Fill any remaining NaN values
-        X = X.fillna(X.mean())
-        X = X.fillna(0)
+        X = pd.DataFrame(buffer, columns=feature_cols, copy=False)
         
         # Make predictions
         predictions = self.predictor.predict(X)
         
         # Create forecast dataframe
         forecast = pd.DataFrame({
-            'timestamp': forecast_df['DateTime'],
+            'timestamp': future_datetimes,
             'seizure_probability': predictions['seizure_probability'],
             'predicted_hours_to_seizure': predictions['predicted_hours_to_seizure'],
-            'risk_level': [self._get_risk_level(p) for p in predictions['seizure_probability']]
+            'risk_level': self._get_risk_level(predictions['seizure_probability'])
         })
         
         return forecast
     
     def _get_risk_level(self, probability):
-        """Convert probability to risk level"""
-        if probability < 0.2:
-            return 'Low'
-        elif probability < 0.4:
-            return 'Moderate'
-        elif probability < 0.6:
-            return 'Elevated'
-        elif probability < 0.8:
-            return 'High'
-        else:
-            return 'Very High'
+        """Convert a probability (or an array of them) to risk level"""
+        return RISK_LEVELS[np.digitize(probability, RISK_THRESHOLDS)]
     
     def get_summary(self):
         """
         Get comprehensive summary including recent history and predictions
         """
-        # Load data with feedback features
-        df, seizures = self.loader.create_hourly_dataset(include_feedback_features=True)
+        # Load data and features once for the whole summary
+        df_features, seizures = self._load_data()
         
         # Get current prediction
-        current_pred = self.get_current_prediction()
+        current_pred = self._predict_from_features(df_features)
         
         # Get recent seizures
-        recent_seizures = seizures.tail(5).copy()
-        recent_seizures['DateTime'] = recent_seizures['DateTime'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        recent_seizures = seizures[['DateTime', 'Duration']].tail(5).to_dict('records')
+        for seizure in recent_seizures:
+            seizure['DateTime'] = seizure['DateTime'].strftime('%Y-%m-%d %H:%M:%S')
         
         # Calculate time since last seizure
         if len(seizures) > 0:
-            last_seizure = seizures.iloc[-1]['DateTime']
+            last_seizure = seizures['DateTime'].iloc[-1]
             now = pd.Timestamp.now()
             hours_since = (now - last_seizure).total_seconds() / 3600
         else:
@@ -187,11 +164,11 @@ class SeizureForecaster:
             'current_prediction': current_pred,
             'hours_since_last_seizure': hours_since,
             'total_seizures_recorded': len(seizures),
-            'recent_seizures': recent_seizures[['DateTime', 'Duration']].to_dict('records'),
+            'recent_seizures': recent_seizures,
             'data_range': {
-                'start': df['DateTime'].min().strftime('%Y-%m-%d'),
-                'end': df['DateTime'].max().strftime('%Y-%m-%d'),
-                'total_hours': len(df)
+                'start': df_features['DateTime'].min().strftime('%Y-%m-%d'),
+                'end': df_features['DateTime'].max().strftime('%Y-%m-%d'),
+                'total_hours': len(df_features)
             }
         }
         
@@ -240,15 +217,15 @@ def main():
     """Example usage"""
     forecaster = SeizureForecaster()
     
-    # Get forecasts for different time horizons
-    forecast_24 = forecaster.get_forecast(hours_ahead=24)
-    forecast_48 = forecaster.get_forecast(hours_ahead=48)
+    # Forecast the longest horizon once; the shorter horizons are its
+    # leading hours
     forecast_72 = forecaster.get_forecast(hours_ahead=72)
     
     # Calculate maximum seizure probability for each horizon
-    max_prob_24 = forecast_24['seizure_probability'].max() * 100
-    max_prob_48 = forecast_48['seizure_probability'].max() * 100
-    max_prob_72 = forecast_72['seizure_probability'].max() * 100
+    probabilities = forecast_72['seizure_probability'].to_numpy()
+    max_prob_24 = probabilities[:24].max() * 100
+    max_prob_48 = probabilities[:48].max() * 100
+    max_prob_72 = probabilities.max() * 100
     
     # Get current timestamp in Arizona timezone
     arizona_tz = pytz.timezone('America/Phoenix')
@@ -281,21 +258,42 @@ def main():
         },
     }
     
-    # Read existing data or create new list
-    try:
-        with open(LONG_TERM_JSON, 'r', encoding='utf-8') as f:
-            predictions_list = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        predictions_list = []
+    append_json_entry(LONG_TERM_JSON, new_entry)
     
-    # Append new entry
-    predictions_list.append(new_entry)
+    return forecaster
+
+def append_json_entry(path, entry):
+    """
+    Append an entry to a JSON array file written with indent=2, without
+    reading or rewriting the existing entries. A missing or malformed
+    file is replaced by a new single-entry array.
+    """
+    entry_text = b'  ' + _dump_json(entry).replace(b'\n', b'\n  ')
     
-    # Write updated list back to file
-    with open(LONG_TERM_JSON, 'w', encoding='utf-8') as f:
-        json.dump(predictions_list, f, indent=2, ensure_ascii=False)
+    try:
+        with open(path, 'r+b') as f:
+            # Find the closing bracket and what precedes it
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 64))
+            tail = f.read()
+            close = tail.rstrip().rfind(b']')
+            before = tail[:close].rstrip()
+            
+            if close >= 0 and before and before[-1:] in (b'}', b'['):
+                f.seek(size - len(tail) + len(before))
+                separator = b'\n' if before.endswith(b'[') else b',\n'
+                f.write(separator + entry_text + b'\n]')
+                f.truncate()
+                return
+    except FileNotFoundError:
+        pass
     
-    return forecaster
+    with open(path, 'wb') as f:
+        f.write(_dump_json([entry]))
+
+def _dump_json(obj):
+    """Serialize obj as UTF-8 JSON bytes indented by 2 spaces"""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
 
 if __name__ == "__main__":
     forecaster = main()
\ No newline at end of file
@@ -8,9 +8,36 @@ import pandas as pd
 import numpy as np
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
+from numba import njit
 from data_preprocessing import DataLoader
 
+# Nanoseconds per hour, for window arithmetic on int64 timestamps
+HOUR_NS = 3_600_000_000_000
+
+@njit(cache=True)
+def _seizures_in_windows(pred_times, seizure_times, window_lengths):
+    """
+    Whether any seizure falls in [prediction, prediction + length) for each
+    window length and prediction, in one sweep over sorted int64 times
+    """
+    n_windows = len(window_lengths)
+    occurred = np.zeros((n_windows, len(pred_times)), dtype=np.bool_)
+    ends = np.zeros(n_windows, dtype=np.int64)
+    start = 0
+    for i in range(len(pred_times)):
+        # Window edges only move forward as predictions advance
+        while start < len(seizure_times) and seizure_times[start] < pred_times[i]:
+            start += 1
+        for w in range(n_windows):
+            end = max(ends[w], start)
+            limit = pred_times[i] + window_lengths[w]
+            while end < len(seizure_times) and seizure_times[end] < limit:
+                end += 1
+            ends[w] = end
+            occurred[w, i] = end > start
+    return occurred
+
 class PredictionFeedback:
     def __init__(self, predictions_file=None, data_folder=None):
         """
@@ -31,24 +58,29 @@ class PredictionFeedback:
         self.seizures_df = None
         self.validation_results = {}
         
+        # Prediction and (sorted) seizure times as int64 nanoseconds
+        self._pred_ns = None
+        self._seizure_ns = None
+        
     def load_predictions(self):
         """Load prediction history from JSON"""
         try:
             with open(self.predictions_file, 'r') as f:
                 predictions_list = json.load(f)
             
-            # Convert to dataframe
-            self.predictions_df = pd.DataFrame(predictions_list)
+            # Convert to dataframe, lifting the nested per-window predictions
+            # ('24h', '48h', '72h') into columns next to the timestamp
+            self.predictions_df = pd.DataFrame([
+                {'timestamp': entry['timestamp'], **entry.get('predictions', {})}
+                for entry in predictions_list
+            ])
             self.predictions_df['timestamp'] = pd.to_datetime(self.predictions_df['timestamp'])
             
-            # Expand predictions columns
-            predictions_expanded = pd.json_normalize(self.predictions_df['predictions'])
-            self.predictions_df = pd.concat([
-                self.predictions_df[['timestamp']], 
-                predictions_expanded
-            ], axis=1)
+            # The log is appended in time order, so only sort when it is not
+            if not self.predictions_df['timestamp'].is_monotonic_increasing:
+                self.predictions_df = self.predictions_df.sort_values('timestamp').reset_index(drop=True)
             
-            self.predictions_df = self.predictions_df.sort_values('timestamp').reset_index(drop=True)
+            self._pred_ns = self.predictions_df['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
             print(f"[OK] Loaded {len(self.predictions_df)} predictions")
             return self.predictions_df
         
@@ -63,6 +95,8 @@ class PredictionFeedback:
         """Load actual seizure data"""
         try:
             self.seizures_df = self.loader.load_seizures()
+            self._seizure_ns = np.sort(
+                self.seizures_df['DateTime'].dropna().to_numpy(dtype='datetime64[ns]').view(np.int64))
             print(f"[OK] Loaded {len(self.seizures_df)} seizure records")
             return self.seizures_df
         except Exception as e:
@@ -83,42 +117,33 @@ class PredictionFeedback:
             print("[ERROR] Cannot validate: missing predictions or seizure data")
             return None
         
-        validation_results = []
+        windows = [(24, '24h'), (48, '48h'), (72, '72h')]
         
-        for idx, pred_row in self.predictions_df.iterrows():
-            pred_time = pred_row['timestamp']
-            
-            # Check each prediction window
-            result = {
-                'prediction_timestamp': pred_time,
-                'pred_24h_prob': pred_row['24h'],
-                'pred_48h_prob': pred_row['48h'],
-                'pred_72h_prob': pred_row['72h'],
-            }
+        validation_results = {
+            'prediction_timestamp': self.predictions_df['timestamp'].to_numpy(),
+            'pred_24h_prob': self.predictions_df['24h'].to_numpy(),
+            'pred_48h_prob': self.predictions_df['48h'].to_numpy(),
+            'pred_72h_prob': self.predictions_df['72h'].to_numpy(),
+        }
+        
+        # Check all prediction windows [prediction, prediction + hours) in
+        # one pass over the predictions and seizures in time order
+        order = np.argsort(self._pred_ns, kind='stable')
+        window_lengths = np.array([hours for hours, _ in windows], dtype=np.int64) * HOUR_NS
+        occurred_sorted = _seizures_in_windows(self._pred_ns[order], self._seizure_ns, window_lengths)
+        occurred_by_window = np.empty_like(occurred_sorted)
+        occurred_by_window[:, order] = occurred_sorted
+        
+        for (_, col), occurred in zip(windows, occurred_by_window):
+            validation_results[f'seizure_occurred_{col}'] = occurred
             
-            # Check for seizures in each window
-            for hours, col in [(24, '24h'), (48, '48h'), (72, '72h')]:
-                window_start = pred_time
-                window_end = pred_time + timedelta(hours=hours)
-                
-                seizures_in_window = self.seizures_df[
-                    (self.seizures_df['DateTime'] >= window_start) & 
-                    (self.seizures_df['DateTime'] < window_end)
-                ]
-                
-                occurred = len(seizures_in_window) > 0
-                result[f'seizure_occurred_{col}'] = occurred
-                
-                # Calculate prediction accuracy (binary)
-                pred_prob = result[f'pred_{col}_prob'] / 100.0
-                # If prob > 0.5, model predicted "yes", else "no"
-                pred_binary = 1 if pred_prob > 0.5 else 0
-                actual_binary = 1 if occurred else 0
-                
-                result[f'correct_{col}'] = (pred_binary == actual_binary)
-                result[f'error_{col}'] = abs(pred_prob - actual_binary)
+            # Calculate prediction accuracy (binary)
+            pred_prob = validation_results[f'pred_{col}_prob'] / 100.0
+            # If prob > 0.5, model predicted "yes", else "no"
+            pred_binary = pred_prob > 0.5
             
-            validation_results.append(result)
+            validation_results[f'correct_{col}'] = pred_binary == occurred
+            validation_results[f'error_{col}'] = np.abs(pred_prob - occurred)
         
         self.validation_results = pd.DataFrame(validation_results)
         return self.validation_results
@@ -157,59 +182,40 @@ class PredictionFeedback:
         if self.seizures_df is None:
             self.load_seizures()
         
-        features_list = []
+        timestamps = self.predictions_df['timestamp']
+        pred_24h = self.predictions_df['24h'].to_numpy()
         
-        for idx, pred_row in self.predictions_df.iterrows():
-            pred_time = pred_row['timestamp']
-            
-            features = {
-                'DateTime': pred_time,
-                'recent_pred_24h_avg': None,
-                'recent_pred_24h_std': None,
-                'recent_pred_48h_avg': None,
-                'recent_pred_48h_std': None,
-                'hours_since_last_prediction': None,
-                'prediction_trend_24h': None,
-                'recent_prediction_variance': None,
-                'confidence_spike': None,
-            }
-            
-            # Get recent predictions (last 7 days)
-            recent_window = pred_time - timedelta(days=7)
-            recent_preds = self.predictions_df[
-                (self.predictions_df['timestamp'] >= recent_window) & 
-                (self.predictions_df['timestamp'] < pred_time)
-            ]
-            
-            if len(recent_preds) > 0:
-                features['recent_pred_24h_avg'] = recent_preds['24h'].mean()
-                features['recent_pred_24h_std'] = recent_preds['24h'].std()
-                features['recent_pred_48h_avg'] = recent_preds['48h'].mean()
-                features['recent_pred_48h_std'] = recent_preds['48h'].std()
-                
-                # Trend: is probability increasing or decreasing?
-                if len(recent_preds) >= 2:
-                    features['prediction_trend_24h'] = (
-                        recent_preds['24h'].iloc[-1] - recent_preds['24h'].iloc[0]
-                    ) / (len(recent_preds) - 1)
-                
-                # Variance in recent predictions
-                features['recent_prediction_variance'] = recent_preds['24h'].var()
-            
+        # Recent predictions are those in the 7 days before each prediction
+        # (the prediction itself excluded)
+        recent = self.predictions_df.set_index('timestamp')[['24h', '48h']].rolling(
+            '7D', closed='left')
+        recent_avg = recent.mean()
+        recent_std = recent.std()
+        
+        # Trend: is probability increasing or decreasing? (first to last
+        # recent prediction, per step between them)
+        times = self._pred_ns
+        first = np.searchsorted(times, times - 7 * 24 * HOUR_NS, side='left')
+        end = np.searchsorted(times, times, side='left')
+        steps = end - first - 1
+        trend = np.full(len(times), np.nan)
+        has_trend = steps >= 1
+        trend[has_trend] = (pred_24h[end[has_trend] - 1] - pred_24h[first[has_trend]]) / steps[has_trend]
+        
+        return pd.DataFrame({
+            'DateTime': timestamps.to_numpy(),
+            'recent_pred_24h_avg': recent_avg['24h'].to_numpy(),
+            'recent_pred_24h_std': recent_std['24h'].to_numpy(),
+            'recent_pred_48h_avg': recent_avg['48h'].to_numpy(),
+            'recent_pred_48h_std': recent_std['48h'].to_numpy(),
             # Hours since last prediction
-            if idx > 0:
-                time_diff = (pred_time - self.predictions_df.iloc[idx-1]['timestamp']).total_seconds() / 3600
-                features['hours_since_last_prediction'] = time_diff
-            
+            'hours_since_last_prediction': (timestamps.diff().dt.total_seconds() / 3600).to_numpy(),
+            'prediction_trend_24h': trend,
+            # Variance in recent predictions
+            'recent_prediction_variance': recent['24h'].var().to_numpy(),
             # Confidence spike: did prediction jump significantly?
-            if idx > 0:
-                prev_pred = self.predictions_df.iloc[idx-1]['24h']
-                curr_pred = pred_row['24h']
-                features['confidence_spike'] = abs(curr_pred - prev_pred)
-            
-            features_list.append(features)
-        
-        return pd.DataFrame(features_list)
+            'confidence_spike': self.predictions_df['24h'].diff().abs().to_numpy(),
+        })
     
     def create_recency_weights(self):
         """
@@ -219,25 +225,17 @@ class PredictionFeedback:
         if self.validation_results.empty:
             self.validate_predictions()
         
-        weights = []
-        now = pd.Timestamp.now()
+        # Recency weight (exponential decay, 30 day half-life) from the
+        # whole days elapsed since each prediction
+        days_old = (pd.Timestamp.now().value - self._pred_ns) // (24 * HOUR_NS)
+        recency_weight = np.exp(-days_old / 30)
         
-        for idx, row in self.validation_results.iterrows():
-            # Recency weight (exponential decay, 30 day half-life)
-            days_old = (now - row['prediction_timestamp']).days
-            recency_weight = np.exp(-days_old / 30)
-            
-            # Accuracy weight (predictions that were correct get boosted)
-            accuracy_24h = 1.0 if row['correct_24h'] else 0.5
-            accuracy_48h = 1.0 if row['correct_48h'] else 0.5
-            accuracy_72h = 1.0 if row['correct_72h'] else 0.5
-            accuracy_weight = np.mean([accuracy_24h, accuracy_48h, accuracy_72h])
-            
-            # Combine weights
-            final_weight = recency_weight * accuracy_weight
-            weights.append(final_weight)
+        # Accuracy weight (predictions that were correct get boosted)
+        correct = self.validation_results[['correct_24h', 'correct_48h', 'correct_72h']].to_numpy()
+        accuracy_weight = np.where(correct, 1.0, 0.5).mean(axis=1)
         
-        return np.array(weights)
+        # Combine weights
+        return recency_weight * accuracy_weight
     
     def print_validation_report(self):
         """Print formatted validation report"""
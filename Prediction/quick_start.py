@@ -21,7 +21,8 @@ def print_section(text):
 
 def check_data_files():
     """Check if required data files exist"""
-    data_folder = '../Data'
+    # Same folder the pipeline reads (data_paths imports nothing heavy)
+    from data_paths import BASE_DATA_DIR as data_folder
     required_files = ['seizures.csv', 'appleWatchData.csv', 'pain.csv']
     
     missing_files = []
@@ -93,9 +94,7 @@ def main():
     # Summary
     print_header("PIPELINE COMPLETE")
     print("\n[INFO] Generated Files:")
-    print("   - models/classification_model_latest.pkl")
-    print("   - models/regression_model_latest.pkl")
-    print("   - models/scaler_latest.pkl")
+    print("   - models/model_latest.joblib")
     print("   - models/feature_importance.json")
     print("   - models/trigger_analysis.json")
     print("   - visualizations/*.png")
@@ -6,19 +6,40 @@ Trains classification and regression models
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, RandomForestRegressor
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier, HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score, mean_absolute_error, mean_squared_error
 import joblib
-import json
+from joblib import Parallel, delayed
+import orjson
 import os
+import shutil
 from datetime import datetime
+from numba import njit
 
 from data_preprocessing import DataLoader
 from feature_engineering import FeatureEngineer
 from prediction_feedback import PredictionFeedback
 
+@njit(cache=True)
+def _impute_and_scale(X, mean, scale):
+    """
+    Standardize X into a new row-major float32 array in one pass (the same
+    arithmetic as scaler.transform); missing values take the training
+    mean, which scales to exactly 0
+    """
+    out = np.empty(X.shape, dtype=np.float32)
+    for i in range(X.shape[0]):
+        for j in range(X.shape[1]):
+            value = X[i, j]
+            if np.isnan(value):
+                out[i, j] = 0
+            else:
+                out[i, j] = (value - mean[j]) / scale[j]
+    return out
+
 class SeizurePredictor:
     def __init__(self, prediction_horizon=6):
         self.prediction_horizon = prediction_horizon
@@ -26,7 +47,14 @@ class SeizurePredictor:
         self.classification_model = None
         self.regression_model = None
         self.feature_cols = None
+        self._mean = None
+        self._scale = None
         
+    def _cache_scaling(self):
+        """Keep the fitted scaler's statistics in float32 for in-place scaling"""
+        self._mean = self.scaler.mean_.astype(np.float32)
+        self._scale = self.scaler.scale_.astype(np.float32)
+    
     def train(self, X, y_classification, y_regression, sample_weights=None):
         """
         Train both classification and regression models
@@ -37,56 +65,52 @@ class SeizurePredictor:
             y_regression: Regression targets
             sample_weights: Optional sample weights (e.g., from prediction feedback)
         """
-        # Handle missing values - robust approach
-        X = X.copy()
+        # Handle missing values in one pass: fill with column means, or 0
+        # for columns with no values (the scaler fitted below keeps these
+        # means, which predict() reuses to impute)
+        X = X.fillna(X.mean().fillna(0))
         
-        # First pass: fill with column means
-        X = X.fillna(X.mean())
+        # Models and scaler work in float32 (the scaler keeps the input dtype)
+        X = X.astype(np.float32)
+        y_classification = y_classification.to_numpy(dtype=np.uint8)
+        y_regression = y_regression.to_numpy()
         
-        # Second pass: fill any remaining NaNs (from columns with all NaN) with 0
-        X = X.fillna(0)
+        self.feature_cols = list(X.columns)
         
-        # Check for any remaining NaN values
-        if X.isnull().any().any():
-            print("[WARNING] Found remaining NaN values after filling, dropping them")
-            X = X.fillna(method='bfill').fillna(method='ffill').fillna(0)
-        
-        # Scale features
+        # Scale features (kept as an array; names come from self.feature_cols)
         X_scaled = self.scaler.fit_transform(X)
-        X_scaled = pd.DataFrame(X_scaled, columns=X.columns, index=X.index)
+        self._cache_scaling()
         
-        # Process sample weights if provided
-        if sample_weights is not None:
-            # If we have fewer weights than samples, extend them (for feedback data)
-            if len(sample_weights) < len(X):
-                # Create default weights for remaining samples
-                extended_weights = np.ones(len(X))
-                # Assign feedback weights where available
-                for i in range(min(len(sample_weights), len(X))):
-                    extended_weights[i] = sample_weights[i]
-                sample_weights = extended_weights
-        
-        # Split data
-        X_train, X_test, y_class_train, y_class_test, y_reg_train, y_reg_test = train_test_split(
-            X_scaled, y_classification, y_regression, 
-            test_size=0.2, random_state=42, stratify=y_classification
+        # Split row positions once and slice features, both targets and
+        # weights with them (stratifying needs two samples of each class)
+        stratify = y_classification if np.bincount(y_classification, minlength=2).min() >= 2 else None
+        idx_train, idx_test = train_test_split(
+            np.arange(len(X_scaled)), test_size=0.2, random_state=42, stratify=stratify
         )
+        X_train, X_test = X_scaled[idx_train], X_scaled[idx_test]
+        y_class_train, y_class_test = y_classification[idx_train], y_classification[idx_test]
+        y_reg_train, y_reg_test = y_regression[idx_train], y_regression[idx_test]
         
-        # Split sample weights accordingly if provided
+        # Gather training weights if provided; rows beyond the supplied
+        # weights (fewer feedback records than samples) default to 1
         weights_train = None
         if sample_weights is not None:
-            X_train_indices = X_train.index
-            weights_train = sample_weights[X_train_indices.tolist()]
-        
-        print("Training classification model...")
-        self.classification_model = self._train_classification(
-            X_train, X_test, y_class_train, y_class_test, sample_weight=weights_train
-        )
-        
-        print("\nTraining regression model...")
-        self.regression_model = self._train_regression(
-            X_train, X_test, y_reg_train, y_reg_test, sample_weight=weights_train
-        )
+            weighted = idx_train < len(sample_weights)
+            weights_train = np.ones(len(idx_train))
+            weights_train[weighted] = sample_weights[idx_train[weighted]]
+        
+        # The two models are independent, so fit them side by side
+        # (tree fitting releases the GIL, so threads share X_train; it
+        # is imputed before scaling and so is read as-is by both)
+        print("Training classification and regression models...")
+        self.classification_model, self.regression_model = Parallel(n_jobs=2, prefer='threads')([
+            delayed(self._train_classification)(
+                X_train, X_test, y_class_train, y_class_test, sample_weight=weights_train
+            ),
+            delayed(self._train_regression)(
+                X_train, X_test, y_reg_train, y_reg_test, sample_weight=weights_train
+            ),
+        ])
         
         return {
             'classification_metrics': self._evaluate_classification(
@@ -95,15 +119,13 @@ class SeizurePredictor:
             'regression_metrics': self._evaluate_regression(
                 self.regression_model, X_test, y_reg_test
             ),
-            'feature_importance': self._get_feature_importance(X.columns)
+            'feature_importance': self._get_feature_importance(
+                self.feature_cols, X_test, y_class_test, y_reg_test
+            )
         }
     
     def _train_classification(self, X_train, X_test, y_train, y_test, sample_weight=None):
         """Train seizure occurrence classifier"""
-        # Ensure no NaN values remain
-        X_train = X_train.fillna(X_train.mean()).fillna(0)
-        X_test = X_test.fillna(X_test.mean()).fillna(0)
-        
         # Try multiple models
         models = {
             'Random Forest': RandomForestClassifier(
@@ -111,12 +133,16 @@ class SeizurePredictor:
                 max_depth=10,
                 min_samples_split=10,
                 class_weight='balanced',
+                n_jobs=-1,
                 random_state=42
             ),
-            'Gradient Boosting': GradientBoostingClassifier(
-                n_estimators=100,
+            'Gradient Boosting': HistGradientBoostingClassifier(
+                max_iter=100,
                 max_depth=5,
                 learning_rate=0.1,
+                max_bins=255,
+                early_stopping=True,
+                class_weight='balanced',
                 random_state=42
             )
         }
@@ -141,14 +167,12 @@ class SeizurePredictor:
     
     def _train_regression(self, X_train, X_test, y_train, y_test, sample_weight=None):
         """Train time-to-next-seizure regressor"""
-        # Ensure no NaN values remain
-        X_train = X_train.fillna(X_train.mean()).fillna(0)
-        X_test = X_test.fillna(X_test.mean()).fillna(0)
-        
-        model = RandomForestRegressor(
-            n_estimators=200,
-            max_depth=10,
-            min_samples_split=10,
+        model = HistGradientBoostingRegressor(
+            max_iter=200,
+            max_depth=8,
+            learning_rate=0.08,
+            max_bins=255,
+            early_stopping=True,
             random_state=42
         )
         
@@ -161,8 +185,11 @@ class SeizurePredictor:
     
     def _evaluate_classification(self, model, X_test, y_test):
         """Evaluate classification model"""
-        y_pred = model.predict(X_test)
-        y_pred_proba = model.predict_proba(X_test)[:, 1]
+        # Labels come from the same probabilities (predict() is their
+        # argmax), so the ensemble is evaluated once
+        proba = model.predict_proba(X_test)
+        y_pred = model.classes_[np.argmax(proba, axis=1)]
+        y_pred_proba = proba[:, 1]
         
         print("\nClassification Results:")
         print(classification_report(y_test, y_pred))
@@ -193,70 +220,94 @@ class SeizurePredictor:
             'rmse': rmse
         }
     
-    def _get_feature_importance(self, feature_names):
+    def _get_feature_importance(self, feature_names, X_test, y_class_test, y_reg_test):
         """Get feature importance from both models"""
         importance_dict = {}
         
-        if hasattr(self.classification_model, 'feature_importances_'):
-            class_importance = pd.DataFrame({
-                'feature': feature_names,
-                'importance': self.classification_model.feature_importances_
-            }).sort_values('importance', ascending=False)
+        for key, model, y_test, scoring in [
+            ('classification', self.classification_model, y_class_test, 'roc_auc'),
+            ('regression', self.regression_model, y_reg_test, 'neg_mean_absolute_error'),
+        ]:
+            # Histogram gradient boosting has no impurity importances, so
+            # measure the score drop when each feature is shuffled instead
+            if hasattr(model, 'feature_importances_'):
+                importances = model.feature_importances_
+            else:
+                importances = permutation_importance(
+                    model, X_test, y_test, scoring=scoring, n_repeats=2, random_state=42
+                ).importances_mean
             
-            importance_dict['classification'] = class_importance.head(20).to_dict('records')
-        
-        if hasattr(self.regression_model, 'feature_importances_'):
-            reg_importance = pd.DataFrame({
+            importance = pd.DataFrame({
                 'feature': feature_names,
-                'importance': self.regression_model.feature_importances_
+                'importance': importances
             }).sort_values('importance', ascending=False)
             
-            importance_dict['regression'] = reg_importance.head(20).to_dict('records')
+            importance_dict[key] = importance.head(20).to_dict('records')
         
         return importance_dict
     
     def save_model(self, filepath='models'):
-        """Save trained models and scaler"""
+        """Save trained models and scaler as one compressed bundle"""
         os.makedirs(filepath, exist_ok=True)
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
-        joblib.dump(self.classification_model, 
-                   os.path.join(filepath, f'classification_model_{timestamp}.pkl'))
-        joblib.dump(self.regression_model, 
-                   os.path.join(filepath, f'regression_model_{timestamp}.pkl'))
-        joblib.dump(self.scaler, 
-                   os.path.join(filepath, f'scaler_{timestamp}.pkl'))
-        
-        # Save latest versions
-        joblib.dump(self.classification_model, 
-                   os.path.join(filepath, 'classification_model_latest.pkl'))
-        joblib.dump(self.regression_model, 
-                   os.path.join(filepath, 'regression_model_latest.pkl'))
-        joblib.dump(self.scaler, 
-                   os.path.join(filepath, 'scaler_latest.pkl'))
+        bundle = {
+            'classification_model': self.classification_model,
+            'regression_model': self.regression_model,
+            'scaler': self.scaler,
+            'feature_cols': self.feature_cols
+        }
+        
+        model_path = os.path.join(filepath, f'model_{timestamp}.joblib')
+        joblib.dump(bundle, model_path, compress=('lz4', 3))
+        
+        # Save latest version as a hard link to the same file (a copy where
+        # links are unsupported), swapped in atomically
+        latest_path = os.path.join(filepath, 'model_latest.joblib')
+        tmp_path = latest_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(model_path, tmp_path)
+        except OSError:
+            shutil.copyfile(model_path, tmp_path)
+        os.replace(tmp_path, latest_path)
         
         print(f"\nModels saved to {filepath}/")
     
     def load_model(self, filepath='models'):
         """Load trained models and scaler"""
-        self.classification_model = joblib.load(
-            os.path.join(filepath, 'classification_model_latest.pkl'))
-        self.regression_model = joblib.load(
-            os.path.join(filepath, 'regression_model_latest.pkl'))
-        self.scaler = joblib.load(
-            os.path.join(filepath, 'scaler_latest.pkl'))
+        try:
+            bundle = joblib.load(os.path.join(filepath, 'model_latest.joblib'))
+        except FileNotFoundError:
+            # Models saved before bundling used one pickle per object
+            bundle = {
+                'classification_model': joblib.load(
+                    os.path.join(filepath, 'classification_model_latest.pkl')),
+                'regression_model': joblib.load(
+                    os.path.join(filepath, 'regression_model_latest.pkl')),
+                'scaler': joblib.load(
+                    os.path.join(filepath, 'scaler_latest.pkl'))
+            }
+        
+        self.classification_model = bundle['classification_model']
+        self.regression_model = bundle['regression_model']
+        self.scaler = bundle['scaler']
+        self.feature_cols = bundle.get('feature_cols')
+        self._cache_scaling()
         
         print("Models loaded successfully")
     
     def predict(self, X):
         """Make predictions on new data"""
-        X = X.copy()
-        # Fill NaN values with column means, then forward fill for any remaining NaNs
-        X = X.fillna(X.mean())
-        X = X.fillna(0)  # Fill any remaining NaNs with 0
+        if self.feature_cols is not None:
+            X = X.reindex(columns=self.feature_cols)
         
-        X_scaled = self.scaler.transform(X)
+        # Impute with the training means (the scaler's mean_) rather than
+        # statistics of this batch, and standardize with the cached float32
+        # statistics; tree traversal reads each sample's features together
+        X_scaled = _impute_and_scale(X.to_numpy(dtype=np.float32), self._mean, self._scale)
         
         seizure_prob = self.classification_model.predict_proba(X_scaled)[:, 1]
         hours_to_seizure = self.regression_model.predict(X_scaled)
@@ -272,21 +323,18 @@ def main():
     print("SEIZURE PREDICTION MODEL TRAINING")
     print("=" * 60)
     
-    # Load and prepare data
-    print("\n1. Loading data...")
+    # Load data and create features (reused from the Parquet feature
+    # cache while the source data is unchanged)
+    print("\n1. Loading data and engineering features...")
     loader = DataLoader()
-    df, seizures = loader.create_hourly_dataset(include_feedback_features=True)
-    print(f"   Loaded {len(df)} hours of data")
-    print(f"   Total seizures: {len(seizures)}")
-    
-    # Create features
-    print("\n2. Engineering features...")
     engineer = FeatureEngineer()
-    df_features = engineer.create_features(df)
+    df_features, seizures = loader.load_features(engineer)
+    print(f"   Loaded {len(df_features)} hours of data")
+    print(f"   Total seizures: {len(seizures)}")
     print(f"   Created {df_features.shape[1]} features")
     
     # Prepare training data
-    print("\n3. Preparing training data...")
+    print("\n2. Preparing training data...")
     X, y_class, y_reg, feature_cols = engineer.prepare_training_data(
         df_features, prediction_horizon=6
     )
@@ -294,7 +342,7 @@ def main():
     print(f"   Positive samples (seizures): {y_class.sum()} ({y_class.sum()/len(y_class)*100:.1f}%)")
     
     # Load and apply prediction feedback weights
-    print("\n4. Loading prediction feedback...")
+    print("\n3. Loading prediction feedback...")
     sample_weights = None
     try:
         feedback = PredictionFeedback()
@@ -320,23 +368,24 @@ def main():
         print("   Training without feedback weights...")
     
     # Train models
-    print("\n5. Training models...")
+    print("\n4. Training models...")
     predictor = SeizurePredictor(prediction_horizon=6)
     metrics = predictor.train(X, y_class, y_reg, sample_weights=sample_weights)
     
     # Save models
-    print("\n6. Saving models...")
+    print("\n5. Saving models...")
     predictor.save_model()
     
     # Save feature importance
-    with open('models/feature_importance.json', 'w') as f:
-        json.dump(metrics['feature_importance'], f, indent=2)
+    with open('models/feature_importance.json', 'wb') as f:
+        f.write(orjson.dumps(metrics['feature_importance'],
+                             option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     print("\n" + "=" * 60)
     print("TRAINING COMPLETE")
     print("=" * 60)
     print("\nTop 10 Important Features (Classification):")
-    for i, feat in enumerate(metrics['feature_importance']['classification'][:10], 1):
+    for i, feat in enumerate(metrics['feature_importance'].get('classification', [])[:10], 1):
         print(f"  {i}. {feat['feature']}: {feat['importance']:.4f}")
     
     return predictor, metrics
@@ -66,8 +66,7 @@ class SeizureVisualizer:
         fig, axes = plt.subplots(1, 2, figsize=(14, 5))
         
         # Hour of day
-        seizures['hour'] = seizures['DateTime'].dt.hour
-        hour_counts = seizures['hour'].value_counts().sort_index()
+        hour_counts = seizures['DateTime'].dt.hour.value_counts().sort_index()
         
         axes[0].bar(hour_counts.index, hour_counts.values, color='steelblue', alpha=0.7)
         axes[0].set_xlabel('Hour of Day', fontsize=12)
@@ -77,9 +76,8 @@ class SeizureVisualizer:
         axes[0].grid(axis='y', alpha=0.3)
         
         # Day of week
-        seizures['day_name'] = seizures['DateTime'].dt.day_name()
         day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        day_counts = seizures['day_name'].value_counts().reindex(day_order)
+        day_counts = seizures['DateTime'].dt.day_name().value_counts().reindex(day_order)
         
         axes[1].bar(range(len(day_counts)), day_counts.values, color='coral', alpha=0.7)
         axes[1].set_xlabel('Day of Week', fontsize=12)